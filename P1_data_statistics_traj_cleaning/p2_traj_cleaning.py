@@ -2,18 +2,26 @@ from __future__ import annotations
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from config import RAW_DATA_COLUMNS
+from helpers import load_raw_data, sequential_intervals
 
 
 def _bootstrap_local_packages() -> None:
+    # The local source checkouts only exist on the author's macOS machine
+    if sys.platform != "darwin":
+        return
     package_roots = [
         Path("/Users/jeremy/Downloads/my_packages/sinbue/src"),
         Path("/Users/jeremy/Downloads/my_packages/iogenius/src"),
@@ -27,23 +35,29 @@ def _bootstrap_local_packages() -> None:
 
 
 def _project_root() -> Path:
-    root = Path(__file__).resolve().parents[1]
-    os.chdir(root)
-    return root
+    os.chdir(PROJECT_ROOT)
+    return PROJECT_ROOT
 
 
-def _load_raw_data(data_path: Path) -> pd.DataFrame:
-    df = pd.read_csv(data_path, header=None, names=RAW_DATA_COLUMNS)
-    df["timeUtc"] = pd.to_datetime(df["timeUtc"], errors="coerce")
-    df["speed"] = df["sog"]
-    return df
+def _prepare_raw_data(df_raw: pd.DataFrame) -> pd.DataFrame:
+    # assign leaves the caller's frame untouched; run_p1 shares it with p1
+    return df_raw.assign(speed=df_raw["sog"])
+
+
+def _segment_quantile(
+    sorted_values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float
+) -> np.ndarray:
+    # Take the fraction relative to each segment start so it keeps full precision
+    offset = q * (counts - 1)
+    floor_offset = np.floor(offset)
+    frac = offset - floor_offset
+    lower = starts + floor_offset.astype(np.int64)
+    upper = starts + np.ceil(offset).astype(np.int64)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * frac
 
 
 def _compute_interval_table(df: pd.DataFrame) -> pd.DataFrame:
-    data = df[["mmsi", "timeUtc"]].dropna(subset=["mmsi", "timeUtc"]).copy()
-    data = data.sort_values(["mmsi", "timeUtc"]).reset_index(drop=True)
-    data["interval_seconds"] = data.groupby("mmsi")["timeUtc"].diff().dt.total_seconds()
-    data = data[data["interval_seconds"].notna() & (data["interval_seconds"] > 0)]
+    data = sequential_intervals(df)
 
     if data.empty:
         return pd.DataFrame(
@@ -57,34 +71,80 @@ def _compute_interval_table(df: pd.DataFrame) -> pd.DataFrame:
             ]
         )
 
-    out = (
-        data.groupby("mmsi")["interval_seconds"]
-        .agg(
-            interval_count="count",
-            avg_interval_seconds="mean",
-            median_interval_seconds="median",
-            p90_interval_seconds=lambda x: x.quantile(0.90),
-        )
-        .reset_index()
+    mmsi = data["mmsi"].to_numpy()
+    seconds = data["interval_seconds"].to_numpy()
+    order = np.lexsort((seconds, mmsi))
+    mmsi = mmsi[order]
+    seconds = seconds[order]
+
+    starts = np.flatnonzero(np.r_[True, mmsi[1:] != mmsi[:-1]])
+    counts = np.diff(np.r_[starts, mmsi.size])
+    out = pd.DataFrame(
+        {
+            "mmsi": mmsi[starts],
+            "interval_count": counts,
+            "avg_interval_seconds": np.add.reduceat(seconds, starts) / counts,
+            "median_interval_seconds": _segment_quantile(seconds, starts, counts, 0.50),
+            "p90_interval_seconds": _segment_quantile(seconds, starts, counts, 0.90),
+        }
     )
     out["avg_frequency_hz"] = 1.0 / out["avg_interval_seconds"]
     return out.sort_values("avg_interval_seconds").reset_index(drop=True)
 
 
 def _build_mmsi_row_change_table(df_raw: pd.DataFrame, df_cleaned: pd.DataFrame) -> pd.DataFrame:
-    raw_counts = df_raw.groupby("mmsi").size().rename("raw_rows")
-    cleaned_counts = df_cleaned.groupby("mmsi").size().rename("cleaned_rows")
-    out = pd.concat([raw_counts, cleaned_counts], axis=1).fillna(0)
-    out[["raw_rows", "cleaned_rows"]] = out[["raw_rows", "cleaned_rows"]].astype(int)
-    out = out.reset_index()
-    out["rows_removed"] = out["raw_rows"] - out["cleaned_rows"]
-    out["removed_ratio_pct"] = (
-        out["rows_removed"] / out["raw_rows"].replace(0, pd.NA) * 100.0
-    ).fillna(0.0)
-    out = out.sort_values(["rows_removed", "raw_rows"], ascending=[False, False]).reset_index(drop=True)
+    raw_codes, mmsi = pd.factorize(df_raw["mmsi"], sort=False)
+    cleaned_codes = mmsi.get_indexer(df_cleaned["mmsi"])
+    mmsi = mmsi.to_numpy()
+    raw_rows = np.bincount(raw_codes[raw_codes >= 0], minlength=len(mmsi))
+    cleaned_rows = np.bincount(cleaned_codes[cleaned_codes >= 0], minlength=len(mmsi))
+    rows_removed = raw_rows - cleaned_rows
+
+    order = np.lexsort((mmsi, -raw_rows, -rows_removed))
+    out = pd.DataFrame(
+        {
+            "mmsi": mmsi[order],
+            "raw_rows": raw_rows[order],
+            "cleaned_rows": cleaned_rows[order],
+            "rows_removed": rows_removed[order],
+            "removed_ratio_pct": rows_removed[order] / raw_rows[order] * 100.0,
+        }
+    )
     return out
 
 
+def _format_timestamps(times: pa.ChunkedArray) -> pa.ChunkedArray:
+    # Like to_csv: use the coarsest sub-second unit that keeps every value exact, plus the
+    # UTC offset for zoned values
+    fmt = "%Y-%m-%d %H:%M:%S" + ("%Ez" if times.type.tz else "")
+    for unit in ("s", "ms", "us"):
+        try:
+            return pc.strftime(times.cast(pa.timestamp(unit, tz=times.type.tz), safe=True), format=fmt)
+        except pa.ArrowInvalid:
+            continue
+    return pc.strftime(times, format=fmt)
+
+
+def _write_cleaned_csv(df_cleaned: pd.DataFrame, csv_path: Path) -> None:
+    table = pa.Table.from_pandas(df_cleaned, preserve_index=False)
+    time_idx = table.schema.get_field_index("timeUtc")
+    table = table.set_column(time_idx, "timeUtc", _format_timestamps(table["timeUtc"]))
+    # Arrow's "needed" style quotes every string, so only use it when text columns other than
+    # the formatted timestamps could hold delimiters or quotes
+    has_text = any(
+        pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+        for field in table.schema
+        if field.name != "timeUtc"
+    )
+    pacsv.write_csv(
+        table,
+        csv_path,
+        write_options=pacsv.WriteOptions(
+            quoting_style="needed" if has_text else "none", quoting_header="none"
+        ),
+    )
+
+
 def _format_diagnostics_report(
     step_df: pd.DataFrame,
     mmsi_row_change_df: pd.DataFrame,
@@ -134,26 +194,12 @@ def _format_diagnostics_report(
     return "\n".join(lines) + "\n"
 
 
-if __name__ == "__main__":
-    pd.set_option("display.max_columns", None)
-    pd.set_option("display.max_rows", 100)
-
-    _bootstrap_local_packages()
-    import iogenius as iog
+def main(df_raw: pd.DataFrame, output_dir: Path, log_dir: Path) -> pd.DataFrame:
     import sinbue as sb
 
-    root = _project_root()
-    iog.set_working_directory(str(root))
-
-    output_dir = Path("./output/P1/p2_traj_cleaning")
-    log_dir = Path("./logs/P1/p2_traj_cleaning")
-    iog.create_new_directory(output_dir)
-    iog.create_new_directory(log_dir)
-
     log_file = log_dir / "p2_traj_cleaning.log"
     with sb.PrintRedirector(log_file):
-        raw_data_path = Path("./data/bridge_msg_filtered.csv")
-        df_raw = _load_raw_data(raw_data_path)
+        df_raw = _prepare_raw_data(df_raw)
         print(f"Input rows: {len(df_raw):,}")
 
         cleaner = sb.AISCleanGenius(
@@ -200,19 +246,35 @@ if __name__ == "__main__":
                 }
             )
 
-        df_cleaned = cleaner.data.copy()
+        df_cleaned = cleaner.data.sort_values(["mmsi", "timeUtc"], ignore_index=True)
         df_cleaned["sog"] = df_cleaned["speed"]
-        df_cleaned = df_cleaned.sort_values(["mmsi", "timeUtc"]).reset_index(drop=True)
         step_df = pd.DataFrame(step_records)
-        raw_interval_df = _compute_interval_table(df_raw)
-        cleaned_interval_df = _compute_interval_table(df_cleaned)
-        mmsi_row_change_df = _build_mmsi_row_change_table(df_raw, df_cleaned)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            raw_interval_future = pool.submit(_compute_interval_table, df_raw)
+            cleaned_interval_future = pool.submit(_compute_interval_table, df_cleaned)
+            mmsi_row_change_future = pool.submit(_build_mmsi_row_change_table, df_raw, df_cleaned)
+        raw_interval_df = raw_interval_future.result()
+        cleaned_interval_df = cleaned_interval_future.result()
+        mmsi_row_change_df = mmsi_row_change_future.result()
 
         cleaned_feather_path = output_dir / "P1_p2_cleaned_traj.feather"
-        df_cleaned.to_feather(cleaned_feather_path)
+        # Uncompressed so p4 can memory-map it without decompressing every column
+        df_cleaned.to_feather(cleaned_feather_path, compression="uncompressed")
+
+        cleaned_parquet_path = output_dir / "P1_p2_cleaned_traj.parquet"
+        df_cleaned.to_parquet(
+            cleaned_parquet_path,
+            engine="pyarrow",
+            compression="zstd",
+            compression_level=3,
+            row_group_size=1_000_000,
+            index=False,
+        )
 
         cleaned_csv_path = output_dir / "P1_p2_cleaned_traj.csv"
-        df_cleaned.to_csv(cleaned_csv_path, index=False)
+        export_csv = os.getenv("EXPORT_CSV", "1") != "0"
+        if export_csv:
+            _write_cleaned_csv(df_cleaned, cleaned_csv_path)
 
         step_volume_path = output_dir / "P1_p2_step_volume_changes.csv"
         step_df.to_csv(step_volume_path, index=False)
@@ -242,9 +304,32 @@ if __name__ == "__main__":
         print(f"Removed ratio: {removed_rows / len(df_raw) * 100:.2f}%")
         print(f"Per-MMSI avg interval (seconds, cleaned): {avg_interval_cleaned:.3f}")
         print(f"Saved feather: {cleaned_feather_path}")
-        print(f"Saved csv: {cleaned_csv_path}")
+        print(f"Saved parquet: {cleaned_parquet_path}")
+        if export_csv:
+            print(f"Saved csv: {cleaned_csv_path}")
         print(f"Saved report: {report_path}")
         print(f"Saved step table: {step_volume_path}")
         print(f"Saved mmsi row-change table: {mmsi_change_path}")
         print(f"Saved mmsi interval table(raw): {mmsi_interval_raw_path}")
         print(f"Saved mmsi interval table(cleaned): {mmsi_interval_cleaned_path}")
+
+    return df_cleaned
+
+
+if __name__ == "__main__":
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.max_rows", 100)
+
+    _bootstrap_local_packages()
+    import iogenius as iog
+
+    root = _project_root()
+    iog.set_working_directory(str(root))
+
+    output_dir = Path("./output/P1/p2_traj_cleaning")
+    log_dir = Path("./logs/P1/p2_traj_cleaning")
+    iog.create_new_directory(output_dir)
+    iog.create_new_directory(log_dir)
+
+    raw_data_path = Path("./data/bridge_msg_filtered.csv")
+    main(load_raw_data(raw_data_path), output_dir, log_dir)
@@ -4,10 +4,22 @@ import os
 import sys
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from helpers import load_raw_data, sequential_intervals
 
 
 def _bootstrap_local_packages() -> None:
+    # The local source checkouts only exist on the author's macOS machine
+    if sys.platform != "darwin":
+        return
     package_roots = [
         Path("/Users/jeremy/Downloads/my_packages/sinbue/src"),
         Path("/Users/jeremy/Downloads/my_packages/iogenius/src"),
@@ -21,58 +33,102 @@ def _bootstrap_local_packages() -> None:
 
 
 def _project_root() -> Path:
-    root = Path(__file__).resolve().parents[1]
-    os.chdir(root)
-    return root
-
-
-def _build_summary(df: pd.DataFrame, raw_rows: int | None = None) -> str:
-    speed_col = "speed" if "speed" in df.columns else "sog"
-    avg_speed = df[speed_col].mean(skipna=True) if speed_col in df.columns else float("nan")
-    valid_speed_count = (
-        df[speed_col].notna().sum() if speed_col in df.columns else 0
-    )
-    unique_id_count = df["id"].nunique() if "id" in df.columns else 0
-    interval_stats = (
-        df.sort_values(["mmsi", "timeUtc"])
-        .groupby("mmsi")["timeUtc"]
-        .diff()
-        .dt.total_seconds()
-    )
-    interval_stats = interval_stats[(interval_stats.notna()) & (interval_stats > 0)]
+    os.chdir(PROJECT_ROOT)
+    return PROJECT_ROOT
+
+
+def _load_cleaned_data(parquet_path: Path, feather_path: Path) -> tuple[pd.DataFrame, int]:
+    if parquet_path.exists():
+        cleaned_columns = pq.read_schema(parquet_path).names
+        reader = pd.read_parquet
+        source_path = parquet_path
+    elif feather_path.exists():
+        with pa.memory_map(str(feather_path)) as source:
+            cleaned_columns = pa.ipc.open_file(source).schema.names
+        reader = pd.read_feather
+        source_path = feather_path
+    else:
+        raise FileNotFoundError(
+            "Cleaned data not found. Please run p2_traj_cleaning.py first."
+        )
+
+    summary_columns = [c for c in ["mmsi", "timeUtc", "id", "speed", "sog"] if c in cleaned_columns]
+    df = reader(source_path, columns=summary_columns)
+    if not pd.api.types.is_datetime64_any_dtype(df["timeUtc"]):
+        df["timeUtc"] = pd.to_datetime(df["timeUtc"], format="ISO8601", errors="coerce")
+    return df, len(cleaned_columns)
+
+
+def _build_summary(
+    df: pd.DataFrame, raw_rows: int | None = None, column_count: int | None = None
+) -> str:
+    cols = set(df.columns)
+    speed_col = "speed" if "speed" in cols else "sog"
+    if speed_col in cols:
+        speed = df[speed_col].to_numpy()
+        valid_speed = speed[~np.isnan(speed)]
+        avg_speed = valid_speed.mean(dtype=np.float64) if valid_speed.size else float("nan")
+        valid_speed_count = valid_speed.size
+    else:
+        avg_speed = float("nan")
+        valid_speed_count = 0
+    unique_id_count = df["id"].nunique() if "id" in cols else 0
+    interval_stats = sequential_intervals(df)["interval_seconds"]
     avg_interval_seconds = interval_stats.mean(skipna=True)
     valid_interval_count = interval_stats.shape[0]
 
-    lines: list[str] = []
-    lines.append("P1_p3 Cleaned AIS Fleet Report")
-    lines.append("=" * 60)
-    lines.append(f"Rows: {len(df):,}")
-    lines.append(f"Columns: {len(df.columns):,}")
-    lines.append(f"Time range: {df['timeUtc'].min()} -> {df['timeUtc'].max()}")
-    lines.append(f"Unique MMSI: {df['mmsi'].nunique():,}")
-    lines.append(f"Unique ID: {unique_id_count:,}")
-    lines.append(f"Average Fleet Speed ({speed_col}): {avg_speed:.3f}")
-    lines.append(f"Speed observations used: {valid_speed_count:,}")
-    lines.append(f"Average Interval Between Points (seconds): {avg_interval_seconds:.3f}")
-    lines.append(f"Interval observations used: {valid_interval_count:,}")
-    lines.append(
-        "Duplicate records (mmsi + timeUtc): "
-        f"{df.duplicated(subset=['mmsi', 'timeUtc']).sum():,}"
-    )
+    lines = [
+        "P1_p3 Cleaned AIS Fleet Report",
+        "=" * 60,
+        f"Rows: {len(df):,}",
+        f"Columns: {column_count if column_count is not None else len(cols):,}",
+        f"Time range: {df['timeUtc'].min()} -> {df['timeUtc'].max()}",
+        f"Unique MMSI: {df['mmsi'].nunique():,}",
+        f"Unique ID: {unique_id_count:,}",
+        f"Average Fleet Speed ({speed_col}): {avg_speed:.3f}",
+        f"Speed observations used: {valid_speed_count:,}",
+        f"Average Interval Between Points (seconds): {avg_interval_seconds:.3f}",
+        f"Interval observations used: {valid_interval_count:,}",
+        (
+            "Duplicate records (mmsi + timeUtc): "
+            f"{df.duplicated(subset=['mmsi', 'timeUtc']).sum():,}"
+        ),
+    ]
     if raw_rows is not None:
         removed_rows = raw_rows - len(df)
         removed_ratio = (removed_rows / raw_rows * 100) if raw_rows else 0.0
-        lines.append("")
-        lines.append("Data Volume Change (Raw -> Cleaned)")
-        lines.append("-" * 60)
-        lines.append(f"Raw rows (before): {raw_rows:,}")
-        lines.append(f"Cleaned rows (after): {len(df):,}")
-        lines.append(f"Row change (after - before): {len(df) - raw_rows:,}")
-        lines.append(f"Removed rows: {removed_rows:,}")
-        lines.append(f"Removed ratio: {removed_ratio:.2f}%")
+        lines.extend(
+            [
+                "",
+                "Data Volume Change (Raw -> Cleaned)",
+                "-" * 60,
+                f"Raw rows (before): {raw_rows:,}",
+                f"Cleaned rows (after): {len(df):,}",
+                f"Row change (after - before): {len(df) - raw_rows:,}",
+                f"Removed rows: {removed_rows:,}",
+                f"Removed ratio: {removed_ratio:.2f}%",
+            ]
+        )
     return "\n".join(lines) + "\n"
 
 
+def main(
+    df_cleaned: pd.DataFrame,
+    raw_rows: int,
+    output_dir: Path,
+    log_dir: Path,
+    column_count: int | None = None,
+) -> None:
+    summary_text = _build_summary(df_cleaned, raw_rows=raw_rows, column_count=column_count)
+    summary_path = output_dir / "P1_p3_cleaned_data_summary.txt"
+    summary_path.write_text(summary_text, encoding="utf-8")
+
+    (log_dir / "p3_cleaned_data_inspection.log").write_text(
+        f"Completed cleaned-data inspection. Summary saved to {summary_path}\n",
+        encoding="utf-8",
+    )
+
+
 if __name__ == "__main__":
     pd.set_option("display.max_columns", None)
     pd.set_option("display.max_rows", 100)
@@ -88,17 +144,10 @@ if __name__ == "__main__":
     iog.create_new_directory(output_dir)
     iog.create_new_directory(log_dir)
 
-    cleaned_data_path = Path("./output/P1/p2_traj_cleaning/P1_p2_cleaned_traj.feather")
+    cleaned_parquet_path = Path("./output/P1/p2_traj_cleaning/P1_p2_cleaned_traj.parquet")
+    cleaned_feather_path = Path("./output/P1/p2_traj_cleaning/P1_p2_cleaned_traj.feather")
     raw_data_path = Path("./data/bridge_msg_filtered.csv")
-    df_cleaned = pd.read_feather(cleaned_data_path)
-    df_cleaned["timeUtc"] = pd.to_datetime(df_cleaned["timeUtc"], errors="coerce")
-    raw_rows = pd.read_csv(raw_data_path, usecols=[0], header=None).shape[0]
-
-    summary_text = _build_summary(df_cleaned, raw_rows=raw_rows)
-    summary_path = output_dir / "P1_p3_cleaned_data_summary.txt"
-    summary_path.write_text(summary_text, encoding="utf-8")
+    df_cleaned, column_count = _load_cleaned_data(cleaned_parquet_path, cleaned_feather_path)
+    raw_rows = len(load_raw_data(raw_data_path, columns=["mmsi"]))
 
-    (log_dir / "p3_cleaned_data_inspection.log").write_text(
-        f"Completed cleaned-data inspection. Summary saved to {summary_path}\n",
-        encoding="utf-8",
-    )
+    main(df_cleaned, raw_rows, output_dir, log_dir, column_count=column_count)
@@ -1,27 +1,36 @@
 from __future__ import annotations
 
+import argparse
+import json
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import cartopy.crs as ccrs
+import matplotlib.colors as mcolors
 import matplotlib.font_manager as fm
-import matplotlib.patches as mpatches
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import pyarrow.feather as pf
+import shapely
 from cartopy.io.img_tiles import MapboxTiles
 from dotenv import load_dotenv
-from matplotlib.collections import PatchCollection
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import PolyCollection
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
-from config import RAW_DATA_COLUMNS
+from helpers import load_raw_data
 
 
 def _bootstrap_local_packages() -> None:
+    # The local source checkouts only exist on the author's macOS machine
+    if sys.platform != "darwin":
+        return
     package_roots = [
         Path("/Users/jeremy/Downloads/my_packages/sinbue/src"),
         Path("/Users/jeremy/Downloads/my_packages/iogenius/src"),
@@ -35,27 +44,30 @@ def _bootstrap_local_packages() -> None:
 
 
 def _project_root() -> Path:
-    root = Path(__file__).resolve().parents[1]
-    os.chdir(root)
-    return root
+    os.chdir(PROJECT_ROOT)
+    return PROJECT_ROOT
 
 
-def _load_raw_data(data_path: Path) -> pd.DataFrame:
-    df = pd.read_csv(data_path, header=None, names=RAW_DATA_COLUMNS)
-    df["timeUtc"] = pd.to_datetime(df["timeUtc"], errors="coerce")
-    return df
-
-
-def _load_cleaned_data(feather_path: Path, csv_path: Path) -> pd.DataFrame:
+def _load_cleaned_data(feather_path: Path, csv_path: Path, csv_cache_path: Path) -> pd.DataFrame:
     if feather_path.exists():
-        df = pd.read_feather(feather_path)
+        source_path = feather_path
     elif csv_path.exists():
-        df = pd.read_csv(csv_path)
+        # Convert the CSV export into p4's own output folder, never into p2's
+        if not csv_cache_path.exists() or csv_cache_path.stat().st_mtime < csv_path.stat().st_mtime:
+            df = pd.read_csv(csv_path)
+            df["timeUtc"] = pd.to_datetime(df["timeUtc"], format="ISO8601", errors="coerce")
+            df.to_feather(csv_cache_path, compression="uncompressed")
+        source_path = csv_cache_path
     else:
         raise FileNotFoundError(
             "Cleaned data not found. Please run p2_traj_cleaning.py first."
         )
-    df["timeUtc"] = pd.to_datetime(df["timeUtc"], errors="coerce")
+
+    df = pf.read_table(source_path, memory_map=True).to_pandas(self_destruct=True)
+    if not pd.api.types.is_datetime64_any_dtype(df["timeUtc"]):
+        df["timeUtc"] = pd.to_datetime(df["timeUtc"], format="ISO8601", errors="coerce")
+    # float32 keeps ~1 m precision, well below the 10 m grid
+    df[["lon", "lat"]] = df[["lon", "lat"]].astype("float32")
     return df
 
 
@@ -67,17 +79,32 @@ def _get_dynamic_extent(
     q_low: float = 0.01,
     q_high: float = 0.99,
     pad_ratio: float = 0.06,
+    cache_path: Path | None = None,
+    input_paths: list[Path] | None = None,
 ) -> tuple[float, float, float, float]:
-    lon_all = pd.concat([df_raw[lon_col], df_cleaned[lon_col]], axis=0).dropna()
-    lat_all = pd.concat([df_raw[lat_col], df_cleaned[lat_col]], axis=0).dropna()
-
-    if lon_all.empty or lat_all.empty:
+    cache_key = None
+    if cache_path is not None and input_paths:
+        cache_key = {
+            "mtimes": [path.stat().st_mtime for path in input_paths],
+            "q_low": q_low,
+            "q_high": q_high,
+            "pad_ratio": pad_ratio,
+        }
+        if cache_path.exists():
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+            if cached.get("key") == cache_key:
+                return tuple(cached["extent"])
+
+    lon_all = np.concatenate([df_raw[lon_col].to_numpy(), df_cleaned[lon_col].to_numpy()])
+    lat_all = np.concatenate([df_raw[lat_col].to_numpy(), df_cleaned[lat_col].to_numpy()])
+    lon_all = lon_all[~np.isnan(lon_all)]
+    lat_all = lat_all[~np.isnan(lat_all)]
+
+    if lon_all.size == 0 or lat_all.size == 0:
         raise ValueError("Cannot determine dynamic extent: missing lon/lat values.")
 
-    lon_min = float(lon_all.quantile(q_low))
-    lon_max = float(lon_all.quantile(q_high))
-    lat_min = float(lat_all.quantile(q_low))
-    lat_max = float(lat_all.quantile(q_high))
+    lon_min, lon_max = (float(v) for v in np.quantile(lon_all, [q_low, q_high]))
+    lat_min, lat_max = (float(v) for v in np.quantile(lat_all, [q_low, q_high]))
 
     lon_span = max(lon_max - lon_min, 1e-6)
     lat_span = max(lat_max - lat_min, 1e-6)
@@ -85,12 +112,15 @@ def _get_dynamic_extent(
     lon_pad = lon_span * pad_ratio
     lat_pad = lat_span * pad_ratio
 
-    return (
+    extent = (
         lon_min - lon_pad,
         lon_max + lon_pad,
         lat_min - lat_pad,
         lat_max + lat_pad,
     )
+    if cache_key is not None:
+        cache_path.write_text(json.dumps({"key": cache_key, "extent": list(extent)}), encoding="utf-8")
+    return extent
 
 
 def _set_plot_font() -> None:
@@ -104,10 +134,17 @@ def _set_plot_font() -> None:
     plt.rcParams["font.family"] = "Times New Roman"
 
 
-def _points_to_grids(df: pd.DataFrame, boundary: tuple[float, float, float, float], resolution: float):
+def _points_to_grids(
+    points: np.ndarray, boundary: tuple[float, float, float, float], resolution: float
+):
+    # Runs in a worker process, so make sure the local packages are importable there too
+    _bootstrap_local_packages()
     import sinbue as sb
 
-    data = df[["lon", "lat"]].dropna().copy()
+    lon = points[:, 0]
+    lat = points[:, 1]
+    mask = ~(np.isnan(lon) | np.isnan(lat))
+    data = pd.DataFrame({"lon": lon[mask], "lat": lat[mask]}, copy=False)
     _, grids = sb.get_points_to_grids(
         data=data,
         cols=["lon", "lat"],
@@ -118,90 +155,160 @@ def _points_to_grids(df: pd.DataFrame, boundary: tuple[float, float, float, floa
     return grids
 
 
-def _grid_to_patches(grid_gdf) -> tuple[list, np.ndarray]:
-    patches: list[mpatches.Polygon] = []
-    values: list[float] = []
+def _panel_pixels(save_dpi: int) -> tuple[int, int]:
+    # Each map panel spans 0.43 x 0.80 of the 18 x 8 inch figure
+    return int(0.43 * 18 * save_dpi), int(0.80 * 8 * save_dpi)
 
-    if "point_count" not in grid_gdf.columns:
-        return patches, np.array(values, dtype=float)
 
-    for _, row in grid_gdf.iterrows():
-        geom = row.geometry
-        value = float(row["point_count"])
+def _choose_render(render: str, cell_count: int, save_dpi: int) -> str:
+    if render not in {"auto", "raster", "vector"}:
+        raise ValueError(f"Unknown render mode: {render}")
+    if render != "auto":
+        return render
+    # Polygons only pay off while cells stay larger than a few pixels of the map panel
+    panel_w_px, panel_h_px = _panel_pixels(save_dpi)
+    return "vector" if cell_count <= panel_w_px * panel_h_px / 4 else "raster"
 
-        if geom is None or geom.is_empty:
-            continue
 
-        if geom.geom_type == "Polygon":
-            coords = np.asarray(geom.exterior.coords)
-            patches.append(mpatches.Polygon(coords, closed=True))
-            values.append(value)
-        elif geom.geom_type == "MultiPolygon":
-            for part in geom.geoms:
-                coords = np.asarray(part.exterior.coords)
-                patches.append(mpatches.Polygon(coords, closed=True))
-                values.append(value)
+def _points_to_raster(
+    points: np.ndarray,
+    boundary: tuple[float, float, float, float],
+    resolution: float,
+    max_bins: int,
+) -> tuple[np.ndarray, np.ndarray, np.ma.MaskedArray]:
+    # Display-only approximation of the sinbue grid: bins start at the boundary corner and
+    # use a metre-to-degree step at the centre latitude, so they do not line up cell for cell
+    # with the *_res10.geojson grids written next to the figure.
+    lon_min, lon_max, lat_min, lat_max = boundary
+    lat_step = resolution * 360 / (2 * np.pi * 6371004)
+    lon_step = lat_step / np.cos(np.radians((lat_min + lat_max) / 2))
+    n_lon = max(int(np.ceil((lon_max - lon_min) / lon_step)), 1)
+    n_lat = max(int(np.ceil((lat_max - lat_min) / lat_step)), 1)
+    if n_lon * n_lat > max_bins:
+        # Bins finer than the panel's pixels are invisible, so coarsen to the pixel budget
+        scale = np.sqrt(n_lon * n_lat / max_bins)
+        lon_step *= scale
+        lat_step *= scale
+        n_lon = max(int(np.ceil((lon_max - lon_min) / lon_step)), 1)
+        n_lat = max(int(np.ceil((lat_max - lat_min) / lat_step)), 1)
+    lon_edges = lon_min + lon_step * np.arange(n_lon + 1)
+    lat_edges = lat_min + lat_step * np.arange(n_lat + 1)
+
+    lon = points[:, 0]
+    lat = points[:, 1]
+    mask = ~(np.isnan(lon) | np.isnan(lat))
+    counts, _, _ = np.histogram2d(lon[mask], lat[mask], bins=[lon_edges, lat_edges])
+    return lon_edges, lat_edges, np.ma.masked_equal(counts.T, 0)
+
+
+def _grid_to_patches(grid_gdf) -> tuple[list[np.ndarray], np.ndarray]:
+    if "point_count" not in grid_gdf.columns or grid_gdf.empty:
+        return [], np.array([], dtype=float)
+
+    geoms = grid_gdf.geometry.values
+    valid_mask = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    geom_types = shapely.get_type_id(geoms)
+    if (geom_types[valid_mask] == shapely.GeometryType.MULTIPOLYGON).any():
+        # Square grids rarely yield MultiPolygons; only then pay for exploding the frame
+        grid_gdf = grid_gdf[valid_mask].explode(index_parts=False)
+        grid_gdf = grid_gdf[grid_gdf.geometry.geom_type == "Polygon"]
+        geoms = grid_gdf.geometry.values
+        values = grid_gdf["point_count"].to_numpy(dtype=np.float64)
+    else:
+        polygon_mask = valid_mask & (geom_types == shapely.GeometryType.POLYGON)
+        geoms = geoms[polygon_mask]
+        values = grid_gdf["point_count"].to_numpy(dtype=np.float64, copy=False)[polygon_mask]
 
-    return patches, np.array(values, dtype=float)
+    # Pull every exterior vertex in one call and split it back into per-polygon rings
+    rings = shapely.get_exterior_ring(geoms)
+    coords, ring_index = shapely.get_coordinates(rings, return_index=True)
+    offsets = np.searchsorted(ring_index, np.arange(1, len(rings)))
+    verts = np.split(coords, offsets) if len(rings) else []
+    return verts, values
 
 
 def _plot_before_after_grids(
-    raw_grids,
-    cleaned_grids,
+    raw_density,
+    cleaned_density,
     extent: tuple[float, float, float, float],
     save_path: Path,
     mapbox: MapboxTiles,
+    render: str,
     basemap_zoom: int = 16,
     vmin_percentile: int = 0,
     vmax_percentile: int = 85,
+    save_dpi: int = 150,
 ) -> None:
+    # raw_density/cleaned_density are grid GeoDataFrames for "vector" and
+    # _points_to_raster outputs for "raster"
+    if render not in {"raster", "vector"}:
+        raise ValueError(f"Unknown render mode: {render}")
+
     proj = ccrs.PlateCarree()
     lon_min, lon_max, lat_min, lat_max = extent
 
-    raw_patches, raw_values = _grid_to_patches(raw_grids)
-    cleaned_patches, cleaned_values = _grid_to_patches(cleaned_grids)
+    if render == "raster":
+        raw_layer, cleaned_layer = raw_density, cleaned_density
+        raw_values = raw_density[2].compressed()
+        cleaned_values = cleaned_density[2].compressed()
+    else:
+        raw_layer, raw_values = _grid_to_patches(raw_density)
+        cleaned_layer, cleaned_values = _grid_to_patches(cleaned_density)
 
-    all_values = []
-    if len(raw_values) > 0:
-        all_values.append(raw_values)
-    if len(cleaned_values) > 0:
-        all_values.append(cleaned_values)
+    combined = np.empty(raw_values.size + cleaned_values.size, dtype=float)
+    combined[: raw_values.size] = raw_values
+    combined[raw_values.size :] = cleaned_values
 
-    vmin, vmax = None, None
-    if all_values:
-        combined = np.concatenate(all_values)
-        vmin = np.percentile(combined, vmin_percentile) if vmin_percentile > 0 else combined.min()
-        vmax = np.percentile(combined, vmax_percentile)
+    # Both panels and the colorbar share one normalization
+    norm = None
+    if combined.size > 0:
+        vmin, vmax = np.percentile(combined, [max(vmin_percentile, 0), vmax_percentile])
+        norm = mcolors.Normalize(vmin=vmin, vmax=vmax)
 
-    fig = plt.figure(figsize=(18, 8), dpi=300)
+    fig = plt.figure(figsize=(18, 8), dpi=save_dpi)
     ax1 = fig.add_axes([0.04, 0.12, 0.43, 0.80], projection=mapbox.crs)
     ax2 = fig.add_axes([0.51, 0.12, 0.43, 0.80], projection=mapbox.crs)
     cax = fig.add_axes([0.95, 0.12, 0.015, 0.80])
 
     panels = [
-        (ax1, raw_patches, raw_values, "Before Cleaning (Raw Grid Density)"),
-        (ax2, cleaned_patches, cleaned_values, "After Cleaning (Cleaned Grid Density)"),
+        (ax1, raw_layer, raw_values, "Before Cleaning (Raw Grid Density)"),
+        (ax2, cleaned_layer, cleaned_values, "After Cleaning (Cleaned Grid Density)"),
     ]
 
-    last_collection = None
-    for ax, patches, values, title in panels:
+    for ax, layer, values, title in panels:
         ax.set_extent([lon_min, lon_max, lat_min, lat_max], crs=proj)
         ax.add_image(mapbox, basemap_zoom)
 
-        if len(patches) > 0 and vmin is not None and vmax is not None:
-            collection = PatchCollection(
-                patches,
-                cmap="viridis",
-                alpha=0.55,
-                linewidths=0.2,
-                edgecolor="none",
-                zorder=3,
-            )
-            collection.set_transform(proj)
-            collection.set_array(values)
-            collection.set_clim(vmin, vmax)
-            ax.add_collection(collection)
-            last_collection = collection
+        if values.size > 0 and norm is not None:
+            if render == "raster":
+                lon_edges, lat_edges, counts = layer
+                ax.pcolormesh(
+                    lon_edges,
+                    lat_edges,
+                    counts,
+                    cmap="viridis",
+                    alpha=0.55,
+                    norm=norm,
+                    transform=proj,
+                    zorder=3,
+                    antialiased=False,
+                    rasterized=True,
+                )
+            else:
+                collection = PolyCollection(
+                    layer,
+                    cmap="viridis",
+                    norm=norm,
+                    alpha=0.55,
+                    linewidths=0.2,
+                    edgecolor="none",
+                    zorder=3,
+                    antialiased=False,
+                )
+                collection.set_rasterized(True)
+                collection.set_transform(proj)
+                collection.set_array(values)
+                ax.add_collection(collection)
 
         gl = ax.gridlines(draw_labels=True, linewidth=0.5, color="gray", alpha=0.5, linestyle=":")
         gl.top_labels = False
@@ -210,13 +317,19 @@ def _plot_before_after_grids(
         gl.ylabel_style = {"size": 9}
         ax.set_title(title, fontsize=13, fontweight="bold")
 
-    if last_collection is not None:
-        cbar = plt.colorbar(last_collection, cax=cax, orientation="vertical", extend="max")
+    if norm is not None:
+        cbar = plt.colorbar(
+            ScalarMappable(norm=norm, cmap="viridis"),
+            cax=cax,
+            orientation="vertical",
+            extend="max",
+            alpha=0.55,
+        )
         cbar.set_label("Low <- Grid Point Count -> High", fontsize=12, fontweight="bold")
         cbar.set_ticks([])
         cbar.ax.tick_params(length=0)
 
-    fig.savefig(save_path, format="png", dpi=300)
+    fig.savefig(save_path, format="png", dpi=save_dpi, pil_kwargs={"compress_level": 1})
     plt.close(fig)
 
 
@@ -244,10 +357,22 @@ def _write_log(
         f"Raw active grid cells: {raw_grid_count:,}\n"
         f"Cleaned active grid cells: {cleaned_grid_count:,}\n"
     )
-    log_path.write_text(log_text, encoding="utf-8")
+    log_path.write_bytes(log_text.encode("utf-8"))
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot raw vs cleaned grid density.")
+    parser.add_argument(
+        "--publication", action="store_true", help="Render the figure at 300 dpi for publication."
+    )
+    parser.add_argument(
+        "--render",
+        choices=["auto", "raster", "vector"],
+        default="auto",
+        help="Draw grid cells as polygons, as a raster, or pick from the panel pixel budget.",
+    )
+    args = parser.parse_args()
+
     pd.set_option("display.max_columns", None)
     pd.set_option("display.max_rows", 100)
 
@@ -269,35 +394,69 @@ if __name__ == "__main__":
     cleaned_feather_path = Path("./output/P1/p2_traj_cleaning/P1_p2_cleaned_traj.feather")
     cleaned_csv_path = Path("./output/P1/p2_traj_cleaning/P1_p2_cleaned_traj.csv")
 
-    df_raw = _load_raw_data(raw_data_path)
-    df_cleaned = _load_cleaned_data(cleaned_feather_path, cleaned_csv_path)
+    df_raw = load_raw_data(raw_data_path, columns=["lon", "lat"]).astype("float32")
+    cleaned_csv_cache_path = output_dir / "P1_p4_cleaned_traj_from_csv.feather"
+    df_cleaned = _load_cleaned_data(cleaned_feather_path, cleaned_csv_path, cleaned_csv_cache_path)
+    cleaned_source_path = cleaned_feather_path if cleaned_feather_path.exists() else cleaned_csv_path
 
-    dynamic_extent = _get_dynamic_extent(df_raw=df_raw, df_cleaned=df_cleaned)
+    dynamic_extent = _get_dynamic_extent(
+        df_raw=df_raw,
+        df_cleaned=df_cleaned,
+        cache_path=output_dir / ".extent_cache.json",
+        input_paths=[raw_data_path, cleaned_source_path],
+    )
     grid_resolution = 10.0
 
     mapbox_token = os.getenv("MAPBOX_TOKEN")
     if not mapbox_token:
         raise ValueError("Please set MAPBOX_TOKEN in environment or .env")
-    mapbox = MapboxTiles(mapbox_token, "light-v10")
-
-    raw_grids = _points_to_grids(df=df_raw, boundary=dynamic_extent, resolution=grid_resolution)
-    cleaned_grids = _points_to_grids(df=df_cleaned, boundary=dynamic_extent, resolution=grid_resolution)
+    # Cache fetched tiles on disk so both panels and later runs reuse them. Older Cartopy
+    # releases name the cache folder after the tile class only, so keep one cache per style.
+    mapbox_style = "light-v10"
+    tile_cache_dir = output_dir / ".tile_cache" / mapbox_style
+    mapbox = MapboxTiles(mapbox_token, mapbox_style, cache=str(tile_cache_dir))
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        raw_future = pool.submit(
+            _points_to_grids, df_raw[["lon", "lat"]].to_numpy(), dynamic_extent, grid_resolution
+        )
+        cleaned_future = pool.submit(
+            _points_to_grids, df_cleaned[["lon", "lat"]].to_numpy(), dynamic_extent, grid_resolution
+        )
+        raw_grids = raw_future.result()
+        cleaned_grids = cleaned_future.result()
+
+    save_dpi = 300 if args.publication else 150
+    render = _choose_render(args.render, max(len(raw_grids), len(cleaned_grids)), save_dpi)
+    if render == "raster":
+        panel_w_px, panel_h_px = _panel_pixels(save_dpi)
+        max_bins = panel_w_px * panel_h_px
+        raw_density = _points_to_raster(
+            df_raw[["lon", "lat"]].to_numpy(), dynamic_extent, grid_resolution, max_bins
+        )
+        cleaned_density = _points_to_raster(
+            df_cleaned[["lon", "lat"]].to_numpy(), dynamic_extent, grid_resolution, max_bins
+        )
+    else:
+        raw_density, cleaned_density = raw_grids, cleaned_grids
 
     raw_grid_path = output_dir / "P1_p4_raw_grids_res10.geojson"
     cleaned_grid_path = output_dir / "P1_p4_cleaned_grids_res10.geojson"
-    raw_grids.to_file(raw_grid_path, driver="GeoJSON")
-    cleaned_grids.to_file(cleaned_grid_path, driver="GeoJSON")
+    raw_grids.to_file(raw_grid_path, driver="GeoJSON", engine="pyogrio")
+    cleaned_grids.to_file(cleaned_grid_path, driver="GeoJSON", engine="pyogrio")
 
     figure_path = output_dir / "P1_p4_grid_before_after_res10.png"
     _plot_before_after_grids(
-        raw_grids=raw_grids,
-        cleaned_grids=cleaned_grids,
+        raw_density=raw_density,
+        cleaned_density=cleaned_density,
         extent=dynamic_extent,
         save_path=figure_path,
         mapbox=mapbox,
+        render=render,
         basemap_zoom=16,
         vmin_percentile=0,
         vmax_percentile=85,
+        save_dpi=save_dpi,
     )
 
     _write_log(
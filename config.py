@@ -10,3 +10,24 @@ RAW_DATA_COLUMNS = [
     "trueHeading",
     "id",
 ]
+
+# Arrow types used when parsing the raw CSV. lon/lat stay float64 because
+# the cleaning steps derive speeds from consecutive positions, and sog stays
+# float64 because p2 copies it into the speed column the cleaner thresholds
+# on, where float32 rounding could flip rows near a limit. timeUtc is
+# read as text and converted by pandas, so malformed values become NaT.
+# The parsed table is converted to NumPy-backed columns, not ArrowDtype:
+# every column is numeric or datetime, and sinbue and the interval
+# helper work directly on NumPy arrays.
+RAW_DATA_TYPES = {
+    "cog": "float32",
+    "lat": "float64",
+    "lon": "float64",
+    "mmsi": "int64",
+    "navigationStatus": "int8",
+    "rot": "float32",
+    "sog": "float64",
+    "timeUtc": "string",
+    "trueHeading": "float32",
+    "id": "int64",
+}
@@ -1,6 +1,15 @@
+import json
 import os
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as pf
+
+from config import RAW_DATA_COLUMNS, RAW_DATA_TYPES
+
 
 def set_working_directory() -> Path:
     """
@@ -39,6 +48,104 @@ def setup_paths() -> dict:
     return paths
 
 
+_RAW_TYPES_METADATA_KEY = b"raw_data_types"
+
+
+def _raw_cache_is_current(cache_path: Path, data_path: Path) -> bool:
+    """
+    Check that the Feather copy is newer than the CSV and was parsed with RAW_DATA_TYPES.
+
+    Args:
+        cache_path: Path to the Feather copy
+        data_path: Path to the raw CSV
+
+    Returns:
+        bool: True when the Feather copy can be read instead of the CSV
+    """
+    if not cache_path.exists() or cache_path.stat().st_mtime < data_path.stat().st_mtime:
+        return False
+    try:
+        with pa.memory_map(str(cache_path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except pa.ArrowInvalid:
+        # Unreadable copy, e.g. truncated by an interrupted write
+        return False
+    return metadata.get(_RAW_TYPES_METADATA_KEY) == json.dumps(RAW_DATA_TYPES).encode()
+
+
+def load_raw_data(data_path: Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Load the raw AIS CSV, keeping a Feather copy next to it.
+    The CSV is only parsed when the Feather copy is missing, older than it,
+    or was written with different RAW_DATA_TYPES.
+
+    Args:
+        data_path: Path to the raw headerless CSV
+        columns: Optional subset of columns to return
+
+    Returns:
+        pd.DataFrame: Raw AIS records typed by RAW_DATA_TYPES
+    """
+    data_path = Path(data_path)
+    cache_path = data_path.with_suffix(".feather")
+    if _raw_cache_is_current(cache_path, data_path):
+        return pd.read_feather(cache_path, columns=columns)
+
+    table = pacsv.read_csv(
+        data_path,
+        read_options=pacsv.ReadOptions(column_names=RAW_DATA_COLUMNS),
+        convert_options=pacsv.ConvertOptions(
+            column_types={col: pa.type_for_alias(t) for col, t in RAW_DATA_TYPES.items()}
+        ),
+    )
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    df["timeUtc"] = pd.to_datetime(df["timeUtc"], format="ISO8601", errors="coerce")
+    cache_table = pa.Table.from_pandas(df, preserve_index=False)
+    cache_table = cache_table.replace_schema_metadata(
+        {
+            **(cache_table.schema.metadata or {}),
+            _RAW_TYPES_METADATA_KEY: json.dumps(RAW_DATA_TYPES).encode(),
+        }
+    )
+    # Write next to the target and swap it in, so an interrupted run never leaves a partial cache
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        pf.write_feather(cache_table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def sequential_intervals(
+    df: pd.DataFrame, id_col: str = "mmsi", time_col: str = "timeUtc"
+) -> pd.DataFrame:
+    """
+    Compute the positive time gaps between consecutive records of each vessel.
+    Gaps are taken on the int64 nanosecond view, so no timedelta array is built.
+
+    Args:
+        df: AIS records with a vessel ID column and a datetime column
+        id_col: Vessel ID column
+        time_col: Timestamp column
+
+    Returns:
+        pd.DataFrame: id_col and interval_seconds for every positive gap, ordered by ID then time
+    """
+    data = df[[id_col, time_col]].dropna()
+    ids = data[id_col].to_numpy()
+    times = data[time_col].to_numpy(dtype="datetime64[ns]").view("i8")
+    order = np.lexsort((times, ids))
+    ids = ids[order]
+    times = times[order]
+
+    gaps = np.diff(times)
+    keep = (ids[1:] == ids[:-1]) & (gaps > 0)
+    return pd.DataFrame({id_col: ids[1:][keep], "interval_seconds": gaps[keep] / 1e9})
+
+
 # Example usage:
 if __name__ == "__main__":
     # Set working directory
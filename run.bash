@@ -40,8 +40,14 @@ for script in "${SCRIPTS[@]}"; do
     start_time=$(date +%s)
     start_datetime=$(date)
     
+    # The pipeline run produces the final figures, so render them at publication dpi
+    script_args=()
+    case "$script" in
+        *p4_points_before_after_plot.py) script_args=(--publication) ;;
+    esac
+
     # Run Python script in conda environment and wait for completion
-    conda run -n "$CONDA_ENV" python "$script" 2>> "$ERROR_LOG" && wait
+    conda run -n "$CONDA_ENV" python "$script" "${script_args[@]}" 2>> "$ERROR_LOG" && wait
     
     if [ $? -eq 0 ]; then
         # Calculate execution time
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from helpers import load_raw_data
+from P1_data_statistics_traj_cleaning import p1_raw_data_inspection as p1
+from P1_data_statistics_traj_cleaning import p2_traj_cleaning as p2
+from P1_data_statistics_traj_cleaning import p3_cleaned_data_inspection as p3
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+
+
+def _project_root() -> Path:
+    os.chdir(PROJECT_ROOT)
+    return PROJECT_ROOT
+
+
+if __name__ == "__main__":
+    pd.set_option("display.max_columns", None)
+    pd.set_option("display.max_rows", 100)
+
+    p1._bootstrap_local_packages()
+    import iogenius as iog
+
+    root = _project_root()
+    iog.set_working_directory(str(root))
+
+    script_dirs: dict[str, tuple[Path, Path]] = {}
+    for name in ["p1_raw_data_inspection", "p2_traj_cleaning", "p3_cleaned_data_inspection"]:
+        output_dir = Path(f"./output/P1/{name}")
+        log_dir = Path(f"./logs/P1/{name}")
+        iog.create_new_directory(output_dir)
+        iog.create_new_directory(log_dir)
+        script_dirs[name] = (output_dir, log_dir)
+
+    # Load once and keep the frames in memory for all three steps
+    raw_data_path = Path("./data/bridge_msg_filtered.csv")
+    df_raw = load_raw_data(raw_data_path)
+
+    # p2 swaps the global sys.stdout for its log file, so nothing else may
+    # run until it returns; the two inspection steps only write files
+    df_cleaned = p2.main(df_raw, *script_dirs["p2_traj_cleaning"])
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        raw_summary = pool.submit(p1.main, df_raw, *script_dirs["p1_raw_data_inspection"])
+        cleaned_summary = pool.submit(
+            p3.main, df_cleaned, len(df_raw), *script_dirs["p3_cleaned_data_inspection"]
+        )
+        raw_summary.result()
+        cleaned_summary.result()